@@ -1,8 +1,11 @@
 """ics Calendar for Home Assistant."""
 
+import asyncio
 import logging
+from collections import defaultdict
 
 import homeassistant.helpers.config_validation as cv
+import httpx
 import voluptuous as vol
 from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
 from homeassistant.const import (
@@ -17,12 +20,14 @@ from homeassistant.const import (
 )
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import discovery
+from homeassistant.helpers.httpx_client import create_async_httpx_client
 from homeassistant.helpers.issue_registry import (
     IssueSeverity,
     async_create_issue,
 )
 from homeassistant.helpers.typing import ConfigType
 
+from .calendardata import create_host_semaphores
 from .const import (
     CONF_ACCEPT_HEADER,
     CONF_ADV_CONNECT_OPTS,
@@ -38,6 +43,8 @@ from .const import (
     CONF_SUMMARY_DEFAULT,
     CONF_SUMMARY_DEFAULT_DEFAULT,
     CONF_USER_AGENT,
+    DATA_HOST_SEMAPHORES,
+    DATA_HTTPX_CLIENT,
     DOMAIN,
 )
 
@@ -169,6 +176,42 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     return True
 
 
+@callback
+def async_get_httpx_client(hass: HomeAssistant) -> httpx.AsyncClient:
+    """Return the httpx.AsyncClient shared by all ics calendars.
+
+    This is a Home Assistant httpx client with HTTP/2 enabled, which lets
+    calendars on the same host share one connection when the server
+    supports it.  It is created on first use, kept across reloads, and
+    closed by Home Assistant when it stops.
+
+    This method must be run in the event loop.
+    """
+    if (client := hass.data.get(DATA_HTTPX_CLIENT)) is None:
+        client = hass.data[DATA_HTTPX_CLIENT] = create_async_httpx_client(
+            hass, http2=True
+        )
+
+    return client
+
+
+@callback
+def async_get_host_semaphores(
+    hass: HomeAssistant,
+) -> defaultdict[str, asyncio.Semaphore]:
+    """Return the per-host download semaphores shared by all ics calendars.
+
+    They are kept next to the shared httpx client, so that the limit on
+    parallel downloads applies to all calendars using that client.
+
+    This method must be run in the event loop.
+    """
+    if (semaphores := hass.data.get(DATA_HOST_SEMAPHORES)) is None:
+        semaphores = hass.data[DATA_HOST_SEMAPHORES] = create_host_semaphores()
+
+    return semaphores
+
+
 @callback
 def _async_find_matching_config_entry(hass):
     for entry in hass.config_entries.async_entries(DOMAIN):
@@ -203,6 +246,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = full_data
+    async_get_httpx_client(hass)
     await hass.config_entries.async_forward_entry_setups(entry, ["calendar"])
     return True
 
@@ -26,10 +26,10 @@ from homeassistant.const import (
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity import generate_entity_id
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.httpx_client import get_async_client
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from homeassistant.util.dt import now as hanow
 
+from . import async_get_host_semaphores, async_get_httpx_client
 from .calendardata import CalendarData
 from .const import (
     CONF_ACCEPT_HEADER,
@@ -56,6 +56,11 @@ OFFSET = "!!"
 
 MIN_TIME_BETWEEN_UPDATES = timedelta(minutes=15)
 
+# Each calendar is a separate entity that downloads its own data.  Home
+# Assistant already runs async entity updates without a limit; this just
+# declares that default explicitly.
+PARALLEL_UPDATES = 0
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -276,7 +281,7 @@ class ICSCalendarData:  # pylint: disable=R0902
         self._hass = hass
 
         self._calendar_data = CalendarData(
-            get_async_client(hass),
+            async_get_httpx_client(hass),
             _LOGGER,
             {
                 "name": self.name,
@@ -285,6 +290,7 @@ class ICSCalendarData:  # pylint: disable=R0902
                     minutes=device_data[CONF_DOWNLOAD_INTERVAL]
                 ),
             },
+            async_get_host_semaphores(hass),
         )
 
         self._calendar_data.set_headers(
@@ -1,12 +1,59 @@
 """Provide CalendarData class."""
 
+import asyncio
+import codecs
+import hashlib
+from collections import defaultdict
 from logging import Logger
+from time import monotonic
 
 import httpx
 import httpx_auth
 from homeassistant.util.dt import now as hanow
 
-# from urllib.error import ContentTooShortError, HTTPError, URLError
+# Maximum number of downloads allowed to run at the same time for one host.
+MAX_PARALLEL_DOWNLOADS = 5
+# Longest Retry-After delay (in seconds) we are willing to wait for.
+MAX_RETRY_AFTER = 60
+# Size of the chunks in which calendar data is read from the server.
+DOWNLOAD_CHUNK_SIZE = 65536
+# Templates that _make_url replaces in the calendar's URL.
+_TEMPLATE_TOKENS = ("{year}", "{month}")
+
+
+def create_host_semaphores() -> defaultdict[str, asyncio.Semaphore]:
+    """Return a mapping that creates a download semaphore for each host.
+
+    CalendarData objects that share the mapping share the limit of
+    MAX_PARALLEL_DOWNLOADS parallel downloads per host.
+    """
+    return defaultdict(lambda: asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS))
+
+
+def _get_retry_after(response: httpx.Response) -> int | None:
+    """Return the Retry-After delay in seconds, or None if not usable.
+
+    Only the delay-seconds form of the header is supported.  A delay longer
+    than MAX_RETRY_AFTER is treated as if no delay was given.
+    """
+    retry_after = response.headers.get("Retry-After", "").strip()
+    if not retry_after.isdigit():
+        return None
+    delay = int(retry_after)
+    return delay if delay <= MAX_RETRY_AFTER else None
+
+
+def _sniff_encoding(data: bytes, default: str) -> str:
+    """Return the encoding given by data's byte order mark, or default.
+
+    A byte order mark takes precedence over the charset sent by the server.
+    The returned codecs also strip the byte order mark while decoding.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return default
 
 
 class DigestWithMultiAuth(httpx.DigestAuth, httpx_auth.SupportMultiAuth):
@@ -30,6 +77,7 @@ class CalendarData:  # pylint: disable=R0902
         async_client: httpx.AsyncClient,
         logger: Logger,
         conf: dict,
+        host_semaphores: defaultdict[str, asyncio.Semaphore] | None = None,
     ):
         """Construct CalendarData object.
 
@@ -39,44 +87,59 @@ class CalendarData:  # pylint: disable=R0902
         :type logger: Logger
         :param conf: Configuration options
         :type conf: dict
+        :param host_semaphores: Per-host download semaphores, as returned by
+            create_host_semaphores, shared with other CalendarData objects
+        :type host_semaphores: defaultdict[str, asyncio.Semaphore] | None
         """
         self._auth = None
         self._calendar_data = None
-        self._headers = []
+        self._calendar_text = None
+        self._encoding = "utf-8"
+        self._headers = {}
         self._last_download = None
-        self._min_update_time = conf["min_update_time"]
+        self._min_update_seconds = conf["min_update_time"].total_seconds()
         self.logger = logger
         self.name = conf["name"]
         self.url = conf["url"]
+        self._url_has_template = any(
+            token in self.url for token in _TEMPLATE_TOKENS
+        )
         self.connection_timeout = None
         self._httpx = async_client
+        if host_semaphores is None:
+            host_semaphores = create_host_semaphores()
+        self._host_semaphores = host_semaphores
+        self._conditional_headers = None
+        self._validators_url = None
+        self._digest = None
 
     async def download_calendar(self) -> bool:
         """Download the calendar data.
 
         This only downloads data if self.min_update_time has passed since the
-        last download.
+        last download.  If the server reports that the calendar has not been
+        modified since the last download, or if the downloaded data is the
+        same as the cached data, the cached data is kept.
 
-        returns: True if data was downloaded, otherwise False.
+        returns: True if new data was downloaded, otherwise False.
         rtype: bool
         """
         self.logger.debug("%s: download_calendar start", self.name)
         if (
-            self._calendar_data is None
+            (self._calendar_data is None and self._calendar_text is None)
             or self._last_download is None
-            or (hanow() - self._last_download) > self._min_update_time
+            or (monotonic() - self._last_download) > self._min_update_seconds
         ):
-            self._calendar_data = None
             next_url: str = self._make_url()
             self.logger.debug(
                 "%s: Downloading calendar data from: %s",
                 self.name,
                 next_url,
             )
-            await self._download_data(next_url)
-            self._last_download = hanow()
+            downloaded = await self._download_data(next_url)
+            self._last_download = monotonic()
             self.logger.debug("%s: download_calendar done", self.name)
-            return self._calendar_data is not None
+            return downloaded
 
         self.logger.debug("%s: download_calendar skipped download", self.name)
         return False
@@ -84,10 +147,20 @@ class CalendarData:  # pylint: disable=R0902
     def get(self) -> str:
         """Get the calendar data that was downloaded.
 
+        The downloaded data is kept as bytes, and is only decoded the first
+        time it is requested after each download.  The bytes are released
+        once decoded, so only one copy of the calendar is held.
+
         :return: The downloaded calendar data.
         :rtype: str
         """
-        return self._calendar_data
+        if self._calendar_text is None and self._calendar_data is not None:
+            encoding = _sniff_encoding(self._calendar_data, self._encoding)
+            self._calendar_text = self._decode_data(
+                self._calendar_data.decode(encoding, errors="replace")
+            )
+            self._calendar_data = None
+        return self._calendar_text
 
     def set_headers(
         self,
@@ -104,6 +177,9 @@ class CalendarData:  # pylint: disable=R0902
         If the user_agent parameter is not "", a User-agent header will be
         added to the urlopener.
 
+        The headers and auth object are built once here, and reused for every
+        download.
+
         :param user_name: The user name
         :type user_name: str
         :param password: The password
@@ -119,9 +195,9 @@ class CalendarData:  # pylint: disable=R0902
             ) + DigestWithMultiAuth(user_name, password)
 
         if user_agent != "":
-            self._headers.append(("User-agent", user_agent))
+            self._headers["User-agent"] = user_agent
         if accept_header != "":
-            self._headers.append(("Accept", accept_header))
+            self._headers["Accept"] = accept_header
 
     def set_timeout(self, connection_timeout: float):
         """Set the connection timeout.
@@ -134,23 +210,36 @@ class CalendarData:  # pylint: disable=R0902
     def _decode_data(self, data):
         return data.replace("\0", "")
 
-    async def _download_data(self, url):  # noqa: C901
-        """Download the calendar data."""
+    async def _download_data(self, url) -> bool:  # noqa: C901
+        """Download the calendar data.
+
+        returns: True if new data was downloaded, otherwise False.
+        rtype: bool
+        """
         self.logger.debug("%s: _download_data start", self.name)
+        headers = self._headers
+        if url == self._validators_url:
+            headers = self._conditional_headers
         try:
-            response = await self._httpx.get(
-                url,
-                auth=self._auth,
-                headers=self._headers,
-                follow_redirects=True,
-                timeout=self.connection_timeout,
-            )
+            response, data = await self._get_response(url, headers)
+            if response.status_code == 304:
+                self.logger.debug("%s: _download_data not modified", self.name)
+                return False
             if response.status_code >= 400:
                 raise httpx.HTTPStatusError(
                     "status error", request=None, response=response
                 )
-            self._calendar_data = self._decode_data(response.text)
+            self._set_validators(url, response)
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if digest == self._digest:
+                self.logger.debug("%s: _download_data unchanged", self.name)
+                return False
+            self._calendar_data = data
+            self._calendar_text = None
+            self._encoding = response.encoding
+            self._digest = digest
             self.logger.debug("%s: _download_data done", self.name)
+            return True
         except httpx.HTTPStatusError as http_status_error:
             self.logger.error(
                 "%s: Failed to open url(%s): %s",
@@ -176,9 +265,80 @@ class CalendarData:  # pylint: disable=R0902
             self.logger.error(
                 "%s: Failed to open url!", self.name, exc_info=True
             )
+        self._calendar_data = None
+        self._calendar_text = None
+        self._digest = None
+        self._set_validators(None, None)
+        return False
+
+    def _set_validators(self, url, response: httpx.Response | None):
+        """Remember the ETag and Last-Modified headers sent for url.
+
+        They are sent back as If-None-Match and If-Modified-Since on the next
+        download of the same url, so the server can answer with 304 Not
+        Modified instead of sending the calendar again.  The headers for that
+        download are built here, so they are not rebuilt on every download.
+        """
+        self._conditional_headers = self._headers
+        self._validators_url = url
+        if response is None:
+            return
+        validators = {}
+        if etag := response.headers.get("ETag"):
+            validators["If-None-Match"] = etag
+        if last_modified := response.headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = last_modified
+        if validators:
+            self._conditional_headers = {**self._headers, **validators}
+
+    async def _get_response(
+        self, url: str, headers
+    ) -> tuple[httpx.Response, bytearray | None]:
+        """Get url, retrying once if the server asks us to slow down."""
+        response, data = await self._get(url, headers)
+        if response.status_code == 429:
+            retry_after = _get_retry_after(response)
+            if retry_after is not None:
+                self.logger.debug(
+                    "%s: Rate limited, retrying in %d seconds",
+                    self.name,
+                    retry_after,
+                )
+                await asyncio.sleep(retry_after)
+                response, data = await self._get(url, headers)
+        return response, data
+
+    async def _get(
+        self, url: str, headers
+    ) -> tuple[httpx.Response, bytearray | None]:
+        """Get url, limiting the number of parallel requests per host.
+
+        The body is streamed into a single buffer as it arrives, rather than
+        being buffered by httpx and then copied.  For 304 Not Modified or
+        error responses the body is still read, so the connection can go
+        back to the pool, but None is returned in place of the data.
+        """
+        async with self._host_semaphores[httpx.URL(url).host]:
+            async with self._httpx.stream(
+                "GET",
+                url,
+                auth=self._auth,
+                headers=headers,
+                follow_redirects=True,
+                timeout=self.connection_timeout,
+            ) as response:
+                if response.status_code == 304 or response.status_code >= 400:
+                    await response.aread()
+                    return response, None
+                data = bytearray()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    data.extend(chunk)
+                return response, data
 
     def _make_url(self):
         """Replace templates in url and encode."""
+        if not self._url_has_template:
+            return self.url
         now = hanow()
         return self.url.replace("{year}", f"{now.year:04}").replace(
             "{month}", f"{now.month:02}"
@@ -1,24 +1,28 @@
 """Constants for ics_calendar platform."""
 
-VERSION = "5.1.0"
-DOMAIN = "ics_calendar"
+from typing import Final
 
-CONF_DEVICE_ID = "device_id"
-CONF_CALENDARS = "calendars"
-CONF_DAYS = "days"
-CONF_INCLUDE_ALL_DAY = "include_all_day"
-CONF_PARSER = "parser"
-CONF_DOWNLOAD_INTERVAL = "download_interval"
-CONF_USER_AGENT = "user_agent"
-CONF_OFFSET_HOURS = "offset_hours"
-CONF_ACCEPT_HEADER = "accept_header"
-CONF_CONNECTION_TIMEOUT = "connection_timeout"
-CONF_SET_TIMEOUT = "set_connection_timeout"
-CONF_REQUIRES_AUTH = "requires_auth"
-CONF_ADV_CONNECT_OPTS = "advanced_connection_options"
-CONF_SUMMARY_DEFAULT = "summary_default"
+VERSION: Final = "5.1.0"
+DOMAIN: Final = "ics_calendar"
+DATA_HTTPX_CLIENT: Final = "ics_calendar_httpx_client"
+DATA_HOST_SEMAPHORES: Final = "ics_calendar_host_semaphores"
+
+CONF_DEVICE_ID: Final = "device_id"
+CONF_CALENDARS: Final = "calendars"
+CONF_DAYS: Final = "days"
+CONF_INCLUDE_ALL_DAY: Final = "include_all_day"
+CONF_PARSER: Final = "parser"
+CONF_DOWNLOAD_INTERVAL: Final = "download_interval"
+CONF_USER_AGENT: Final = "user_agent"
+CONF_OFFSET_HOURS: Final = "offset_hours"
+CONF_ACCEPT_HEADER: Final = "accept_header"
+CONF_CONNECTION_TIMEOUT: Final = "connection_timeout"
+CONF_SET_TIMEOUT: Final = "set_connection_timeout"
+CONF_REQUIRES_AUTH: Final = "requires_auth"
+CONF_ADV_CONNECT_OPTS: Final = "advanced_connection_options"
+CONF_SUMMARY_DEFAULT: Final = "summary_default"
 # It'd be really nifty if this could be a translatable string, but it seems
 # that's not supported, unless I want to roll my own interpretation of the
 # translate/*.json files. :(
 # See also https://github.com/home-assistant/core/issues/125075
-CONF_SUMMARY_DEFAULT_DEFAULT = "No title"
+CONF_SUMMARY_DEFAULT_DEFAULT: Final = "No title"
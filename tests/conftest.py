@@ -4,7 +4,9 @@ import json
 import logging
 from http import HTTPStatus
 
+import httpx
 import pytest
+import pytest_asyncio
 from dateutil import parser as dtparser
 
 from custom_components.ics_calendar.const import DOMAIN
@@ -308,6 +310,13 @@ def expected_data(file_name, expected_name):
         return json.loads(file_handle.read(), object_pairs_hook=datetime_hook)
 
 
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def shared_httpx_client():
+    """Provide one httpx.AsyncClient for every test in the session."""
+    async with httpx.AsyncClient() as client:
+        yield client
+
+
 @pytest.fixture(autouse=True)
 def logger():
     """Provide autouse fixture for logger."""
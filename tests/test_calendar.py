@@ -12,7 +12,11 @@ from homeassistant.helpers.template import DATE_STR_FORMAT
 from homeassistant.setup import async_setup_component
 from homeassistant.util import dt as hadt
 
-from custom_components.ics_calendar.const import DOMAIN
+from custom_components.ics_calendar.const import (
+    DATA_HOST_SEMAPHORES,
+    DATA_HTTPX_CLIENT,
+    DOMAIN,
+)
 
 pytest_plugins = "pytest_homeassistant_custom_component"
 
@@ -226,6 +230,81 @@ class TestCalendar:
             include_all_day=True, now=ANY, days=ANY, offset_hours=0
         )
 
+    @pytest.mark.asyncio
+    @patch(
+        "custom_components.ics_calendar.calendardata.CalendarData.download_calendar",
+        return_value=False,
+        new_callable=AsyncMock,
+    )
+    @patch(
+        "custom_components.ics_calendar.calendardata.CalendarData.get",
+        return_value=_mocked_calendar_data("tests/allday.ics"),
+    )
+    @patch(
+        "custom_components.ics_calendar.parsers.parser_rie.ParserRIE"
+        ".get_current_event",
+        return_value=_mocked_event(),
+    )
+    async def test_calendar_setup_shares_client(
+        self,
+        mock_event,
+        mock_get,
+        mock_download,
+        hass,
+        allday_config,
+        noallday_config,
+    ):
+        """Test that all calendars use the same client and semaphores."""
+        config = copy.deepcopy(allday_config)
+        config[DOMAIN]["calendars"] += noallday_config[DOMAIN]["calendars"]
+        assert await async_setup_component(hass, DOMAIN, config)
+        await hass.async_block_till_done()
+
+        component = hass.data["calendar"]
+        calendar_data = [
+            component.get_entity(entity_id).data._calendar_data
+            for entity_id in ("calendar.allday", "calendar.noallday")
+        ]
+        for data in calendar_data:
+            assert data._httpx is hass.data[DATA_HTTPX_CLIENT]
+            assert data._host_semaphores is hass.data[DATA_HOST_SEMAPHORES]
+
+    @pytest.mark.asyncio
+    @patch(
+        "custom_components.ics_calendar.calendardata.CalendarData.download_calendar",
+        return_value=False,
+        new_callable=AsyncMock,
+    )
+    @patch(
+        "custom_components.ics_calendar.calendardata.CalendarData.get",
+        return_value=_mocked_calendar_data("tests/allday.ics"),
+    )
+    @patch(
+        "custom_components.ics_calendar.parsers.parser_rie.ParserRIE"
+        ".get_current_event",
+        return_value=_mocked_event(),
+    )
+    async def test_calendar_reload_reuses_client(
+        self,
+        mock_event,
+        mock_get,
+        mock_download,
+        hass,
+        allday_config,
+    ):
+        """Test that reloading an entry keeps the same httpx client."""
+        assert await async_setup_component(hass, DOMAIN, allday_config)
+        await hass.async_block_till_done()
+        client = hass.data[DATA_HTTPX_CLIENT]
+
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            assert await hass.config_entries.async_reload(entry.entry_id)
+        await hass.async_block_till_done()
+
+        entity = hass.data["calendar"].get_entity("calendar.allday")
+        assert entity.data._calendar_data._httpx is client
+        assert not client.is_closed
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize("set_tz", ["utc"], indirect=True)
     @patch(
@@ -1,19 +1,21 @@
 """Test the CalendarData class."""
 
-import email
+import asyncio
 import re
-from datetime import timedelta
-from io import BytesIO
+from datetime import datetime, timedelta
+from itertools import count
 from unittest.mock import patch
-from urllib.request import HTTPHandler
-from urllib.response import addinfourl
 
+import brotli
 import httpx
 import pytest
-from dateutil import parser as dtparser
-from pytest_httpx import httpx_mock
+from pytest_httpx import IteratorStream, httpx_mock
 
-from custom_components.ics_calendar.calendardata import CalendarData
+from custom_components.ics_calendar.calendardata import (
+    MAX_PARALLEL_DOWNLOADS,
+    CalendarData,
+    create_host_semaphores,
+)
 
 BINARY_CALENDAR_DATA = b"calendar data"
 BINARY_CALENDAR_DATA_2 = b"2 calendar data"
@@ -24,84 +26,47 @@ CALENDAR_NAME = "TESTcalendar"
 TEST_URL = "http://127.0.0.1/test/allday.ics"
 TEST_TEMPLATE_URL = "http://127.0.0.1/test/{year}/{month}/allday.ics"
 TEST_TEMPLATE_URL_REPLACED = "http://127.0.0.1/test/2022/01/allday.ics"
+TEST_TEMPLATE_NOW = datetime(2022, 1, 1)
 
 
-def set_calendar_data(calendar_data: CalendarData, data: str):
+def set_calendar_data(calendar_data: CalendarData, data: bytes):
     """Set _calendarData for the passed CalendarData object."""
     calendar_data._calendar_data = data
 
 
-def mock_response(req, data: str, encoding: str = None):
-    """Return an HttpResponse object with the given data."""
-    # resp = addinfourl(BytesIO(data), "message", req.get_full_url())
-    header_string = """Content-type: application/octet-stream
-Content-length: {len(data)}
-"""
-    if encoding is not None:
-        header_string += f"Content-Encoding: {encoding}\n"
-
-    resp = addinfourl(
-        BytesIO(data),
-        email.message_from_string(header_string),
-        req.get_full_url(),
-        200,
-    )
-    resp.msg = "OK"
-    return resp
-
-
-class MockHTTPHandlerTimeoutValue:
-    """Mock HTTPHandler that reports timeout value."""
-
-    def http_open(self, req):
-        """Provide http_open to return the timeout value."""
-        timeout_str = f"{req.timeout}"
-        return mock_response(req, timeout_str.encode("utf-8"))
-
-
 class TestCalendarData:
     """Test the CalendarData class."""
 
-    def test_set_headers_none(self, logger, hass):
-        """Test set_headers without user name, password, or user agent."""
-        calendar_data = CalendarData(
-            httpx.AsyncClient(),
-            logger,
-            {
-                "name": CALENDAR_NAME,
-                "url": TEST_URL,
-                "min_update_time": timedelta(minutes=5),
-            },
-        )
-        calendar_data.set_headers("", "", "", "")
-
-    def test_set_accept_header(self, logger, hass):
-        """Test setting accept header by itself.
-
-        This doesn't do much, since set_headers has no failure conditions.  We
-        could test that it actually does what it's supposed to do, except that
-        means checking the implementation.
-        """
-        calendar_data = CalendarData(
-            httpx.AsyncClient(),
-            logger,
-            {
-                "name": CALENDAR_NAME,
-                "url": TEST_URL,
-                "min_update_time": timedelta(minutes=5),
-            },
-        )
-        calendar_data.set_headers("", "", "", "text/calendar")
-
-    def test_set_user_agent(self, logger, hass):
-        """Test setting user agent by itself.
+    @pytest.mark.parametrize(
+        "user_name,password,user_agent,accept_header",
+        [
+            ("", "", "", ""),
+            ("", "", "", "text/calendar"),
+            ("", "", "Mozilla/5.0", ""),
+            ("username", "password", "", ""),
+            ("username", "password", "Mozilla/5.0", ""),
+            ("username", "password", "", "text/calendar"),
+            ("username", "password", "Mozilla/5.0", "text/calendar"),
+        ],
+    )
+    def test_set_headers(
+        self,
+        user_name,
+        password,
+        user_agent,
+        accept_header,
+        logger,
+        hass,
+        shared_httpx_client,
+    ):
+        """Test set_headers with each combination of headers.
 
         This doesn't do much, since set_headers has no failure conditions.  We
         could test that it actually does what it's supposed to do, except that
         means checking the implementation.
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -109,35 +74,14 @@ class TestCalendarData:
                 "min_update_time": timedelta(minutes=5),
             },
         )
-        calendar_data.set_headers("", "", "Mozilla/5.0", "")
-
-    def test_set_username_and_password(self, logger, hass):
-        """Test setting user name and password by themselves.
-
-        This doesn't do much, since set_headers has no failure conditions.  We
-        could test that it actually does what it's supposed to do, except that
-        means checking the implementation.
-        """
-        calendar_data = CalendarData(
-            httpx.AsyncClient(),
-            logger,
-            {
-                "name": CALENDAR_NAME,
-                "url": TEST_URL,
-                "min_update_time": timedelta(minutes=5),
-            },
+        calendar_data.set_headers(
+            user_name, password, user_agent, accept_header
         )
-        calendar_data.set_headers("username", "password", "", "")
 
-    def test_set_username_password_and_user_agent(self, logger, hass):
-        """Test setting user name and password with user agent.
-
-        This doesn't do much, since set_headers has no failure conditions.  We
-        could test that it actually does what it's supposed to do, except that
-        means checking the implementation.
-        """
+    def test_get(self, logger, hass, shared_httpx_client):
+        """Test get method retrieves cached data."""
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -145,17 +89,21 @@ class TestCalendarData:
                 "min_update_time": timedelta(minutes=5),
             },
         )
-        calendar_data.set_headers("username", "password", "Mozilla/5.0", "")
+        set_calendar_data(calendar_data, BINARY_CALENDAR_DATA)
+        assert calendar_data.get() == CALENDAR_DATA
+        assert calendar_data._calendar_data is None
+        assert calendar_data.get() == CALENDAR_DATA
 
-    def test_set_username_password_and_accept_header(self, logger, hass):
-        """Test setting user name and password with accept header.
+    @pytest.mark.asyncio
+    async def test_download_calendar(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test download_calendar sets cache from the mocked HTTPHandler.
 
-        This doesn't do much, since set_headers has no failure conditions.  We
-        could test that it actually does what it's supposed to do, except that
-        means checking the implementation.
+        This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -163,17 +111,17 @@ class TestCalendarData:
                 "min_update_time": timedelta(minutes=5),
             },
         )
-        calendar_data.set_headers("username", "password", "", "text/calendar")
-
-    def test_set_all_headers(self, logger, hass):
-        """Test setting all headers.
+        httpx_mock.add_response(url=TEST_URL, content=BINARY_CALENDAR_DATA)
+        await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA
 
-        This doesn't do much, since set_headers has no failure conditions.  We
-        could test that it actually does what it's supposed to do, except that
-        means checking the implementation.
-        """
+    @pytest.mark.asyncio
+    async def test_download_calendar_brotli(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test download_calendar asks for and decodes brotli data."""
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -181,32 +129,23 @@ class TestCalendarData:
                 "min_update_time": timedelta(minutes=5),
             },
         )
-        calendar_data.set_headers(
-            "username", "password", "Mozilla/5.0", "text/calendar"
-        )
-
-    def test_get(self, logger, hass):
-        """Test get method retrieves cached data."""
-        calendar_data = CalendarData(
-            httpx.AsyncClient(),
-            logger,
-            {
-                "name": CALENDAR_NAME,
-                "url": TEST_URL,
-                "min_update_time": timedelta(minutes=5),
-            },
+        httpx_mock.add_response(
+            url=TEST_URL,
+            stream=IteratorStream([brotli.compress(BINARY_CALENDAR_DATA)]),
+            headers={"Content-Encoding": "br"},
         )
-        set_calendar_data(calendar_data, CALENDAR_DATA)
+        await calendar_data.download_calendar()
+        assert "br" in httpx_mock.get_request().headers["Accept-Encoding"]
         assert calendar_data.get() == CALENDAR_DATA
 
     @pytest.mark.asyncio
-    async def test_download_calendar(self, logger, httpx_mock, hass):
-        """Test download_calendar sets cache from the mocked HTTPHandler.
-
-        This test relies on the success of test_get!
-        """
+    @pytest.mark.parametrize("encoding", ["utf-8-sig", "utf-16"])
+    async def test_download_calendar_byte_order_mark(
+        self, encoding, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test download_calendar decodes data that has a byte order mark."""
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -214,17 +153,19 @@ class TestCalendarData:
                 "min_update_time": timedelta(minutes=5),
             },
         )
-        httpx_mock.add_response(url=TEST_URL, content=BINARY_CALENDAR_DATA)
+        httpx_mock.add_response(
+            url=TEST_URL, content=CALENDAR_DATA.encode(encoding)
+        )
         await calendar_data.download_calendar()
         assert calendar_data.get() == CALENDAR_DATA
 
     @pytest.mark.asyncio
     @patch(
         "custom_components.ics_calendar.calendardata.hanow",
-        return_value=dtparser.parse("2022-01-01T00:00:00"),
+        return_value=TEST_TEMPLATE_NOW,
     )
     async def test_download_calendar_interprets_templates(
-        self, mock_hanow, logger, httpx_mock, hass
+        self, mock_hanow, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test download_calendar sets cache from the mocked HTTPHandler.
 
@@ -246,7 +187,7 @@ class TestCalendarData:
             url=re.compile(".*[{]month[}]"),
         )
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -259,14 +200,14 @@ class TestCalendarData:
 
     @pytest.mark.asyncio
     async def test_download_calendar_decode_error(
-        self, logger, httpx_mock, hass
+        self, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that None is cached for a decode error.
 
         This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -279,13 +220,15 @@ class TestCalendarData:
         assert calendar_data.get() is None
 
     @pytest.mark.asyncio
-    async def test_download_calendar_HTTPError(self, logger, httpx_mock, hass):
+    async def test_download_calendar_HTTPError(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
         """Test that None is cached for HTTPError.
 
         This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -298,14 +241,14 @@ class TestCalendarData:
 
     @pytest.mark.asyncio
     async def test_download_calendar_InvalidURL(
-        self, logger, httpx_mock, hass
+        self, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that None is cached for InvalidURL.
 
         This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -319,14 +262,14 @@ class TestCalendarData:
 
     @pytest.mark.asyncio
     async def test_download_calendar_TimeoutException(
-        self, logger, httpx_mock, hass
+        self, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that None is cached for TimeoutException.
 
         This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -352,14 +295,14 @@ class TestCalendarData:
 
     @pytest.mark.asyncio
     async def test_download_calendar_HTTPStatusError(
-        self, logger, httpx_mock, hass
+        self, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that None is cached for HTTPStatusError.
 
         This test relies on the success of test_get!
         """
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -372,23 +315,90 @@ class TestCalendarData:
         assert calendar_data.get() is None
 
     @pytest.mark.asyncio
-    @patch(
-        "custom_components.ics_calendar.calendardata.hanow",
-        return_value=dtparser.parse("2022-01-01T00:00:00"),
-    )
+    async def test_download_calendar_retry_after(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test that a 429 with Retry-After is retried once."""
+        calendar_data = CalendarData(
+            shared_httpx_client,
+            logger,
+            {
+                "name": CALENDAR_NAME,
+                "url": TEST_URL,
+                "min_update_time": timedelta(minutes=5),
+            },
+        )
+        httpx_mock.add_response(status_code=429, headers={"Retry-After": "0"})
+        httpx_mock.add_response(content=BINARY_CALENDAR_DATA)
+        assert await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA
+
+    @pytest.mark.asyncio
+    async def test_download_calendar_too_many_requests(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test that None is cached for a 429 without usable Retry-After."""
+        calendar_data = CalendarData(
+            shared_httpx_client,
+            logger,
+            {
+                "name": CALENDAR_NAME,
+                "url": TEST_URL,
+                "min_update_time": timedelta(minutes=5),
+            },
+        )
+        httpx_mock.add_response(
+            status_code=429, headers={"Retry-After": "3600"}
+        )
+        assert not await calendar_data.download_calendar()
+        assert calendar_data.get() is None
+
+    @pytest.mark.asyncio
+    async def test_download_calendar_limits_parallel_downloads(
+        self, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test that downloads from one host are limited in parallel."""
+        in_flight = 0
+        max_in_flight = 0
+
+        async def count_in_flight(request: httpx.Request):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, content=BINARY_CALENDAR_DATA)
+
+        httpx_mock.add_callback(count_in_flight, is_reusable=True)
+        host_semaphores = create_host_semaphores()
+        calendars = [
+            CalendarData(
+                shared_httpx_client,
+                logger,
+                {
+                    "name": f"{CALENDAR_NAME}{i}",
+                    "url": f"http://127.0.0.1/test/{i}.ics",
+                    "min_update_time": timedelta(minutes=5),
+                },
+                host_semaphores,
+            )
+            for i in range(2 * MAX_PARALLEL_DOWNLOADS)
+        ]
+        results = await asyncio.gather(
+            *(calendar.download_calendar() for calendar in calendars)
+        )
+        assert all(results)
+        assert max_in_flight == MAX_PARALLEL_DOWNLOADS
+
+    @pytest.mark.asyncio
+    @patch("custom_components.ics_calendar.calendardata.monotonic")
     async def test_download_returns_new_data(
-        self, mock_hanow, logger, httpx_mock, hass
+        self, mock_monotonic, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that get causes downloads if enough time has passed."""
-        mock_hanow.side_effect = [
-            dtparser.parse("2022-01-01T00:00:00"),
-            dtparser.parse("2022-01-01T00:00:00"),
-            dtparser.parse("2022-01-01T00:05:05"),
-            dtparser.parse("2022-01-01T00:05:05"),
-            dtparser.parse("2022-01-01T00:05:05"),
-        ]
+        mock_monotonic.side_effect = [0.0, 305.0, 305.0]
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -405,22 +415,14 @@ class TestCalendarData:
         assert calendar_data.get() == CALENDAR_DATA_2
 
     @pytest.mark.asyncio
-    @patch(
-        "custom_components.ics_calendar.calendardata.hanow",
-        return_value=dtparser.parse("2022-01-01T00:00:00"),
-    )
+    @patch("custom_components.ics_calendar.calendardata.monotonic")
     async def test_download_too_quickly_returns_old_data(
-        self, mock_hanow, logger, httpx_mock, hass
+        self, mock_monotonic, logger, httpx_mock, hass, shared_httpx_client
     ):
         """Test that get does not download if not enough time has passed."""
-        mock_hanow.side_effect = [
-            dtparser.parse("2022-01-01T00:00:00"),
-            dtparser.parse("2022-01-01T00:00:00"),
-            dtparser.parse("2022-01-01T00:04:59"),
-            dtparser.parse("2022-01-01T00:04:59"),
-        ]
+        mock_monotonic.side_effect = [0.0, 299.0]
         calendar_data = CalendarData(
-            httpx.AsyncClient(),
+            shared_httpx_client,
             logger,
             {
                 "name": CALENDAR_NAME,
@@ -439,3 +441,120 @@ class TestCalendarData:
 
         assert not await calendar_data.download_calendar()
         assert calendar_data.get() == CALENDAR_DATA
+
+    @pytest.mark.asyncio
+    @patch("custom_components.ics_calendar.calendardata.monotonic")
+    async def test_download_not_modified_returns_old_data(
+        self, mock_monotonic, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test that cached data is kept when the server returns 304."""
+        mock_monotonic.side_effect = [0.0, 305.0, 305.0]
+        calendar_data = CalendarData(
+            shared_httpx_client,
+            logger,
+            {
+                "name": CALENDAR_NAME,
+                "url": TEST_URL,
+                "min_update_time": timedelta(minutes=5),
+            },
+        )
+        last_modified = "Sat, 01 Jan 2022 00:00:00 GMT"
+        httpx_mock.add_response(
+            content=BINARY_CALENDAR_DATA,
+            headers={"ETag": '"1234"', "Last-Modified": last_modified},
+        )
+        httpx_mock.add_response(
+            status_code=304,
+            match_headers={
+                "If-None-Match": '"1234"',
+                "If-Modified-Since": last_modified,
+            },
+        )
+        assert await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA
+
+        assert not await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA
+
+    @pytest.mark.asyncio
+    @patch("custom_components.ics_calendar.calendardata.monotonic")
+    async def test_download_not_modified_reuses_connection(
+        self, mock_monotonic, logger, hass, socket_enabled
+    ):
+        """Test that a 304 response leaves the connection reusable.
+
+        httpx_mock replaces the connection pool, so this talks HTTP/1.1 to a
+        local server and counts the connections it accepts.
+        """
+        # Every check and every download is 305 seconds after the last one.
+        mock_monotonic.side_effect = count(0.0, 305.0)
+        connections = 0
+        requests = 0
+
+        async def handle(reader, writer):
+            nonlocal connections, requests
+            connections += 1
+            try:
+                while await reader.readuntil(b"\r\n\r\n"):
+                    requests += 1
+                    if requests == 1:
+                        writer.write(
+                            b"HTTP/1.1 200 OK\r\n"
+                            b'ETag: "1234"\r\n'
+                            b"Content-Length: %d\r\n\r\n%s"
+                            % (len(BINARY_CALENDAR_DATA), BINARY_CALENDAR_DATA)
+                        )
+                    else:
+                        writer.write(
+                            b'HTTP/1.1 304 Not Modified\r\nETag: "1234"\r\n\r\n'
+                        )
+                    await writer.drain()
+            except asyncio.IncompleteReadError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server, httpx.AsyncClient() as client:
+            calendar_data = CalendarData(
+                client,
+                logger,
+                {
+                    "name": CALENDAR_NAME,
+                    "url": f"http://127.0.0.1:{port}/test/allday.ics",
+                    "min_update_time": timedelta(minutes=5),
+                },
+            )
+            results = [
+                await calendar_data.download_calendar() for _ in range(4)
+            ]
+
+        assert results == [True, False, False, False]
+        assert requests == 4
+        assert connections == 1
+        assert calendar_data.get() == CALENDAR_DATA
+
+    @pytest.mark.asyncio
+    @patch("custom_components.ics_calendar.calendardata.monotonic")
+    async def test_download_same_data_returns_old_data(
+        self, mock_monotonic, logger, httpx_mock, hass, shared_httpx_client
+    ):
+        """Test that downloading unchanged data does not report new data."""
+        mock_monotonic.side_effect = [0.0, 305.0, 305.0]
+        calendar_data = CalendarData(
+            shared_httpx_client,
+            logger,
+            {
+                "name": CALENDAR_NAME,
+                "url": TEST_URL,
+                "min_update_time": timedelta(minutes=5),
+            },
+        )
+        httpx_mock.add_response(content=BINARY_CALENDAR_DATA)
+        httpx_mock.add_response(content=BINARY_CALENDAR_DATA)
+        assert await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA
+
+        assert not await calendar_data.download_calendar()
+        assert calendar_data.get() == CALENDAR_DATA